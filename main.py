@@ -1,89 +1,352 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Response
 from fastapi.responses import JSONResponse
 import httpx
-from bs4 import BeautifulSoup
+import orjson
+import asyncio
 import logging
 import re
+import time
+from contextlib import asynccontextmanager, suppress
+from datetime import datetime, timedelta, timezone
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # selectolax 미설치 환경에서는 lxml 로 대체
+    LexborHTMLParser = None
+    import lxml.html
+    from lxml import etree
 
 # 로깅 설정
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
-
 # 매일성경 순 (청소년/청년용) URL (?qt_ty=QT6)
 QT_URL = "https://sum.su.or.kr:8888/bible/today?qt_ty=QT6"
 
-async def fetch_qt_data():
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+# 요청마다 TCP/TLS 연결을 새로 맺지 않도록 앱 전체에서 하나의 클라이언트(app.state.http)를 재사용합니다.
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=10, keepalive_expiry=30)
+# lifespan 없이 만든 클라이언트는 호출 사이에 프로세스가 멈췄다 재개될 수 있으므로 연결을 남겨두지 않습니다.
+NO_KEEPALIVE_LIMITS = httpx.Limits(max_keepalive_connections=0)
+
+def _set_client(limits):
+    client = httpx.AsyncClient(timeout=10.0, headers=HEADERS, http2=True, limits=limits)
+    app.state.http = client
+    app.state.http_loop = asyncio.get_running_loop()
+    return client
+
+def get_client():
+    """
+    공유 httpx 클라이언트를 반환합니다. lifespan 이 실행되지 않는 환경(서버리스 등)에서는
+    처음 호출될 때 keep-alive 없는 클라이언트를 생성합니다.
+    클라이언트의 연결 풀은 만든 이벤트 루프에 묶이므로, 실행 중인 루프가 바뀌면(Vercel 등에서
+    호출마다 새 루프를 쓰는 경우) 이전 클라이언트를 버리고 새로 만듭니다.
+    """
+    client = getattr(app.state, "http", None)
+    if client is None or getattr(app.state, "http_loop", None) is not asyncio.get_running_loop():
+        client = _set_client(NO_KEEPALIVE_LIMITS)
+    return client
+
+@asynccontextmanager
+async def lifespan(app):
+    # lifespan 이 관리하는 클라이언트만 keep-alive 연결 풀을 유지
+    _set_client(HTTP_LIMITS)
+    refresher = asyncio.create_task(refresh_qt_periodically())
+    yield
+    refresher.cancel()
+    with suppress(asyncio.CancelledError):
+        await refresher
+    await app.state.http.aclose()
+    app.state.http = None
+
+class ORJSONResponse(JSONResponse):
+    """
+    orjson 으로 직렬화하는 JSON 응답. 한글을 이스케이프 없이 UTF-8 그대로 인코딩합니다.
+    """
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# QT 는 하루에 한 번 바뀌므로 한국 날짜(YYYY-MM-DD) 단위로 완성된 응답(JSON bytes)을 캐시합니다.
+# 당일 중 원본이 수정될 수 있으므로 QT_CACHE_TTL(초)이 지나면 다시 확인합니다.
+KST = timezone(timedelta(hours=9))
+QT_CACHE_TTL = 600
+# 갱신에 실패해 이전 결과를 돌려줄 때, 다음 재시도까지 그 결과를 유지할 시간(초)
+QT_RETRY_AFTER = 60
+# 백그라운드 갱신 주기(초). 캐시가 만료되기 전에 다시 채워지도록 TTL 보다 짧게 둡니다.
+QT_REFRESH_INTERVAL = 300
+# 항목: (만료 시각, 크롤링 결과, 직렬화된 응답)
+_qt_cache: dict[str, tuple[float, dict, bytes]] = {}
+# 진행 중인 크롤링 작업. 동시에 들어온 요청들은 새로 크롤링하지 않고 이 작업의 결과를 함께 기다립니다.
+_qt_refresh_task: asyncio.Task | None = None
+
+# 조건부 요청(If-None-Match / If-Modified-Since)용 상태.
+# 원본이 304 Not Modified 를 돌려주면 마지막으로 파싱한 결과를 그대로 재사용합니다.
+_last_etag: str | None = None
+_last_modified: str | None = None
+_last_qt_data: dict | None = None
+
+# 본문 정보에서 본문 범위와 찬송을 분리하는 패턴: 괄호 유무와 '찬송'/'찬송가' 변형 모두 대응
+_HYMN_RE = re.compile(r"본문\s*[:]?\s*(.*?)\s*[(]?찬송(?:가)?\s*[:]?\s*(.*?)[)]?$")
+
+# 본문 정보에서 "본문 :" / "본문:" 접두어를 한 번에 제거하기 위한 패턴
+_BIBLE_PREFIX_RE = re.compile(r"본문\s*:")
+
+# 해설에서 제외할 소제목("나의 적용", "기도하기")을 한 번의 검색으로 찾는 패턴
+_SKIP_RE = re.compile("나의 적용|기도하기")
+
+if LexborHTMLParser is None:
+    # lxml 경로에서 쓰는 XPath 는 요청마다 컴파일하지 않도록 미리 만들어 둡니다.
+    def _has_class(class_name):
+        return f'contains(concat(" ", normalize-space(@class), " "), " {class_name} ")'
+
+    _XPATH_TITLE = etree.XPath(f'(//*[{_has_class("bible_text")}])[1]')
+    _XPATH_INFO = etree.XPath(f'(//*[{_has_class("bibleinfo_box")}])[1]')
+    _XPATH_BODY = etree.XPath(f'(//*[{_has_class("body_cont")}])[1]')
+    # .body_cont 의 직계 div 중 해설에 쓰이는 b_text / g_text / text 블록만 문서 순서대로 선택
+    _XPATH_CHILD_DIVS = etree.XPath(
+        f'./div[{_has_class("b_text")} or {_has_class("g_text")} or {_has_class("text")}]'
+    )
+    _XPATH_TEXTS = etree.XPath(".//text()")
+
+    # bytes 는 UTF-8 페이지일 때만 넘어오므로 libxml2 의 인코딩 추측을 건너뛰도록 명시합니다.
+    # (selectolax 도 bytes 입력을 UTF-8 로 해석하며, 다른 charset 은 디코딩된 str 로 넘어옵니다.)
+    _HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+
+def _node_texts(node):
+    """
+    node 아래의 텍스트 노드들을 앞뒤 공백을 제거해 반환합니다 (빈 문자열 제외).
+    """
+    texts = []
+    for child in node.traverse(include_text=True):
+        if child.tag == "-text":
+            text = child.text(deep=False).strip()
+            if text:
+                texts.append(text)
+    return texts
+
+def _parse_with_selectolax(html):
+    """
+    selectolax(lexbor)로 제목, 본문 정보, 해설 블록 목록을 추출합니다.
+    해설 블록은 .body_cont 의 직계 div 들을 (클래스 목록, 텍스트) 로 반환합니다.
+    """
+    tree = LexborHTMLParser(html)
+
+    title_element = tree.css_first(".bible_text")
+    sub_title_element = tree.css_first(".bibleinfo_box")
+
+    title_text = title_element.text(strip=True) if title_element else "제목 없음"
+    raw_info = sub_title_element.text(strip=True) if sub_title_element else ""
+
+    body_cont = tree.css_first(".body_cont")
+    if body_cont is None:
+        return title_text, raw_info, None
+
+    sections = []
+    for node in body_cont.iter():
+        if node.tag != "div":
+            continue
+        classes = (node.attributes.get("class") or "").split()
+        sections.append((classes, "\n".join(_node_texts(node))))
+
+    return title_text, raw_info, sections
+
+def _stripped_texts(element):
+    """
+    element 아래의 텍스트 노드들을 앞뒤 공백을 제거해 반환합니다 (빈 문자열 제외).
+    """
+    return [text for text in (node.strip() for node in _XPATH_TEXTS(element)) if text]
+
+def _inline_text(element):
+    """
+    get_text(strip=True) 와 같은 결과. 자식 태그가 없는 요소는 XPath 없이 .text 만 사용합니다.
+    """
+    if len(element) == 0:
+        return (element.text or "").strip()
+    return "".join(_stripped_texts(element))
+
+def _first(xpath, tree):
+    found = xpath(tree)
+    return found[0] if found else None
+
+def _parse_with_lxml(html):
+    """
+    selectolax 를 쓸 수 없을 때 lxml.html + XPath 로 같은 결과를 추출합니다.
+    """
+    tree = lxml.html.fromstring(html, parser=_HTML_PARSER)
+
+    title_element = _first(_XPATH_TITLE, tree)
+    sub_title_element = _first(_XPATH_INFO, tree)
+
+    title_text = _inline_text(title_element) if title_element is not None else "제목 없음"
+    raw_info = _inline_text(sub_title_element) if sub_title_element is not None else ""
+
+    body_cont = _first(_XPATH_BODY, tree)
+    if body_cont is None:
+        return title_text, raw_info, None
+
+    sections = []
+    for child in _XPATH_CHILD_DIVS(body_cont):
+        # 빈 블록은 문자열을 이어 붙이기 전에 건너뜀
+        strings = _stripped_texts(child)
+        if not strings:
+            continue
+        sections.append(((child.get("class") or "").split(), "\n".join(strings)))
+
+    return title_text, raw_info, sections
+
+parse_qt_html = _parse_with_selectolax if LexborHTMLParser is not None else _parse_with_lxml
+
+def _get_cached_qt_response(key):
+    """
+    key(날짜)에 해당하는 캐시가 아직 만료되지 않았으면 반환하고, 아니면 None 을 반환합니다.
+    """
+    entry = _qt_cache.get(key)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[2]
+    return None
+
+def _today_key():
+    return datetime.now(KST).strftime("%Y-%m-%d")
+
+async def _refresh_qt_response(key):
+    """
+    크롤링해서 key(날짜)의 캐시를 갱신하고 응답 bytes 를 반환합니다. _start_refresh 를 통해서만 실행합니다.
+    """
+    qt_data = await crawl_qt_data()
+    if qt_data:
+        previous = next(iter(_qt_cache.values()), None)
+        if previous is not None and previous[1] is qt_data:
+            # 304 Not Modified 로 같은 결과를 받았으면 이전에 만든 응답 bytes 를 그대로 재사용
+            body = previous[2]
+        else:
+            body = orjson.dumps(build_qt_response(qt_data))
+        # 지난 날짜의 캐시는 버리고 오늘 것만 유지
+        _qt_cache.clear()
+        _qt_cache[key] = (time.monotonic() + QT_CACHE_TTL, qt_data, body)
+        return body
+
+    # 갱신에 실패하면 만료되었더라도 같은 날짜의 이전 결과를 반환하고,
+    # 원본이 복구될 때까지 요청마다 다시 크롤링하지 않도록 QT_RETRY_AFTER 동안 유지
+    entry = _qt_cache.get(key)
+    if entry is None:
+        return None
+    _qt_cache[key] = (time.monotonic() + QT_RETRY_AFTER, entry[1], entry[2])
+    return entry[2]
+
+def _start_refresh(key):
+    """
+    진행 중인 크롤링 작업이 있으면 그 작업을, 없으면 새로 시작한 작업을 반환합니다.
+    """
+    global _qt_refresh_task
+    if (
+        _qt_refresh_task is None
+        or _qt_refresh_task.done()
+        # 이전 호출의 루프에서 끝나지 못한 작업은 다른 루프에서 기다릴 수 없으므로 새로 시작
+        or _qt_refresh_task.get_loop() is not asyncio.get_running_loop()
+    ):
+        _qt_refresh_task = asyncio.create_task(_refresh_qt_response(key))
+    return _qt_refresh_task
+
+async def fetch_qt_response():
+    """
+    오늘 날짜의 QT 카카오톡 응답을 직렬화된 JSON bytes 로 반환합니다 (실패 시 None).
+    캐시에 없을 때만 크롤링하며, 동시에 들어온 요청들은 진행 중인 한 번의 크롤링 결과(성공/실패)를 공유합니다.
+    """
+    key = _today_key()
+    body = _get_cached_qt_response(key)
+    if body is not None:
+        return body
+
+    # 한 요청이 끊겨도 다른 요청이 기다리는 크롤링은 취소되지 않도록 shield 로 감쌈
+    return await asyncio.shield(_start_refresh(key))
+
+async def refresh_qt_periodically():
+    """
+    QT_REFRESH_INTERVAL 마다 캐시를 미리 갱신하는 백그라운드 작업.
+    캐시가 만료되기 전에 갱신되므로 /qt 요청은 원본 사이트 응답을 기다리지 않습니다.
+    """
+    while True:
+        try:
+            await _start_refresh(_today_key())
+        except Exception as e:
+            logger.error(f"QT 캐시 갱신 실패: {str(e)}")
+        await asyncio.sleep(QT_REFRESH_INTERVAL)
+
+async def crawl_qt_data():
     """
     매일성경 순(QT6) 내용을 크롤링합니다.
     """
+    global _last_etag, _last_modified, _last_qt_data
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        async with httpx.AsyncClient(timeout=10.0, headers=headers) as client:
-            response = await client.get(QT_URL)
-            response.raise_for_status()
-            
-        soup = BeautifulSoup(response.text, 'html.parser')
+        headers = {}
+        if _last_qt_data is not None:
+            if _last_etag:
+                headers["If-None-Match"] = _last_etag
+            if _last_modified:
+                headers["If-Modified-Since"] = _last_modified
+
+        response = await get_client().get(QT_URL, headers=headers)
+        if response.status_code == 304 and _last_qt_data is not None:
+            return _last_qt_data
+        response.raise_for_status()
 
         # 1. 날짜 및 제목 추출
-        title_element = soup.select_one(".bible_text") 
-        sub_title_element = soup.select_one(".bibleinfo_box") 
-        
-        title_text = title_element.get_text(strip=True) if title_element else "제목 없음"
-        raw_info = sub_title_element.get_text(strip=True) if sub_title_element else ""
-        
+        # UTF-8(또는 charset 미지정) 페이지는 bytes 를 그대로 파서에 넘기고,
+        # 다른 charset 이 지정된 경우에만 httpx 가 헤더에 맞춰 디코딩한 문자열을 사용
+        charset = (response.charset_encoding or "utf-8").lower()
+        html = response.content if charset in ("utf-8", "utf8") else response.text
+        title_text, raw_info, sections = parse_qt_html(html)
+
         bible_range = "본문 정보 없음"
         hymn_text = "-"
         
-        # 정규식 패턴: 괄호 유무와 '찬송'/'찬송가' 변형 모두 대응
-        match = re.search(r"본문\s*[:]?\s*(.*?)\s*[(]?찬송(?:가)?\s*[:]?\s*(.*?)[)]?$", raw_info)
+        match = _HYMN_RE.search(raw_info)
         
         if match:
             bible_range = match.group(1).strip()
             hymn_text = match.group(2).strip()
         else:
-            bible_range = raw_info.replace("본문 :", "").replace("본문:", "").strip()
+            bible_range = _BIBLE_PREFIX_RE.sub("", raw_info).strip()
 
         # 2. 해설 파싱 (나의 적용, 기도하기 제외)
-        body_cont = soup.select_one(".body_cont")
-        
-        commentary_text = ""
-        if body_cont:
+        parts: list[str] = []
+        if sections is not None:
             skip_section = False 
             
-            for child in body_cont.find_all("div", recursive=False):
-                text = child.get_text(separator="\n", strip=True)
+            for classes, text in sections:
                 if not text:
                     continue
                 
-                classes = child.get("class", [])
-                
                 if "b_text" in classes:
                     # 묵상 서론
-                    commentary_text += text + "\n\n"
+                    parts.append(text)
+                    parts.append("\n\n")
                     
                 elif "g_text" in classes:
                     # "나의 적용", "기도하기" 제외
-                    if "나의 적용" in text or "기도하기" in text:
-                        skip_section = True
-                    else:
-                        skip_section = False
-                        commentary_text += f"📖 {text}\n"
+                    skip_section = _SKIP_RE.search(text) is not None
+                    if not skip_section:
+                        parts.extend(("📖 ", text, "\n"))
                     
                 elif "text" in classes:
                     # 본문 내용
                     if not skip_section:
-                        commentary_text += text + "\n\n"
+                        parts.append(text)
+                        parts.append("\n\n")
+
+            commentary_text = "".join(parts)
         else:
             commentary_text = "해설 내용을 불러올 수 없습니다."
 
         if not commentary_text.strip():
              commentary_text = "해설 내용을 찾을 수 없습니다 (HTML 구조 변경 가능성)."
 
-        return {
+        qt_data = {
             "title": title_text,
             "bible_range": bible_range,
             "hymn": hymn_text,
@@ -91,52 +354,66 @@ async def fetch_qt_data():
             "url": QT_URL
         }
 
+        _last_etag = response.headers.get("ETag")
+        _last_modified = response.headers.get("Last-Modified")
+        _last_qt_data = qt_data
+        return qt_data
+
     except Exception as e:
         logger.error(f"QT 크롤링 실패: {str(e)}")
         return None
 
-@app.post("/qt")
-async def get_qt(request: Request):
-    """
-    카카오톡 스킬 서버 엔드포인트
-    """
-    qt_data = await fetch_qt_data()
-
-    if not qt_data:
-        return JSONResponse(content={
-            "version": "2.0",
-            "template": {
-                "outputs": [
-                    {
-                        "simpleText": {
-                            "text": "죄송합니다. 큐티 정보를 가져오는데 실패했습니다."
-                        }
-                    }
-                ]
+# --- 요청마다 바뀌지 않는 카카오톡 응답 조각 ---
+_FAIL_RESPONSE = {
+    "version": "2.0",
+    "template": {
+        "outputs": [
+            {
+                "simpleText": {
+                    "text": "죄송합니다. 큐티 정보를 가져오는데 실패했습니다."
+                }
             }
-        })
+        ]
+    }
+}
+
+_QUICK_REPLIES = [
+    {
+        "messageText": "오늘의 QT",
+        "action": "message",
+        "label": "🔄 QT불러오기"
+    }
+]
 
-    # --- 카카오톡 응답 생성 ---
+_FOOTER_TEMPLATE = "🔗 해설 전문 보기:\n{url}\n\n🌟아침에 말씀으로 시작하며 하나님의 은혜 충만으로 하루를 시작해 보아요🌟"
+
+def build_qt_response(qt_data):
+    """
+    크롤링한 QT 내용으로 카카오톡 스킬 응답(말풍선 3개 + 바로가기 버튼)을 만듭니다.
+    """
     outputs = []
     
     header = f"✝오늘의 QT(순)✝\n\n[{qt_data['title']}]\n본문: {qt_data['bible_range']}\n찬송: {qt_data['hymn']}\n\n"
     full_commentary = qt_data['commentary']
     
     limit_len = 950 - len(header)
-    part_1 = full_commentary[:limit_len]
-    part_2 = full_commentary[limit_len:] 
+    # 헤더가 950자를 넘으면(limit_len < 0) 기존 동작대로 음수 인덱스 기준으로 끝부분이 두 번째 말풍선이 됨
+    tail_start = limit_len if limit_len >= 0 else max(len(full_commentary) + limit_len, 0)
+    remaining = len(full_commentary) - tail_start
     
     # 1. 첫 번째 말풍선
     outputs.append({
         "simpleText": {
-            "text": header + part_1
+            "text": header + full_commentary[:limit_len]
         }
     })
     
-    # 2. 두 번째 말풍선
-    if part_2:
-        if len(part_2) > 1000:
-             part_2 = part_2[:950] + "\n...(내용 더 있음)"
+    # 2. 두 번째 말풍선 (필요한 길이만큼만 잘라서 생성)
+    if remaining > 0:
+        if remaining > 1000:
+            part_2 = full_commentary[tail_start:tail_start + 950] + "\n...(내용 더 있음)"
+        else:
+            part_2 = full_commentary[tail_start:]
              
         outputs.append({
             "simpleText": {
@@ -145,7 +422,7 @@ async def get_qt(request: Request):
         })
 
     # 3. 세 번째 말풍선 (링크 및 인사말)
-    footer_msg = f"🔗 해설 전문 보기:\n{qt_data['url']}\n\n🌟아침에 말씀으로 시작하며 하나님의 은혜 충만으로 하루를 시작해 보아요🌟"
+    footer_msg = _FOOTER_TEMPLATE.format(url=qt_data['url'])
     outputs.append({
         "simpleText": {
             "text": footer_msg
@@ -156,17 +433,24 @@ async def get_qt(request: Request):
         "version": "2.0",
         "template": {
             "outputs": outputs,
-            "quickReplies": [
-                 {
-                    "messageText": "오늘의 QT",
-                    "action": "message",
-                    "label": "🔄 QT불러오기"
-                }
-            ]
+            "quickReplies": _QUICK_REPLIES
         }
     }
 
-    return JSONResponse(content=response_body)
+    return response_body
+
+@app.post("/qt", response_class=ORJSONResponse)
+async def get_qt():
+    """
+    카카오톡 스킬 서버 엔드포인트
+    """
+    body = await fetch_qt_response()
+
+    if body is None:
+        return _FAIL_RESPONSE
+
+    # 캐시된 bytes 를 그대로 내보내 요청마다 직렬화하지 않음
+    return Response(content=body, media_type="application/json")
 
 @app.get("/")
 async def root():
@@ -174,5 +458,17 @@ async def root():
 
 # Vercel 환경에서는 아래 구문이 무시되며, 로컬 테스트 시에만 작동합니다.
 if __name__ == "__main__":
+    import os
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+
+    # ENV=dev 일 때만 자동 리로드(단일 워커), 그 외에는 uvloop + httptools 멀티 워커로 실행
+    dev_mode = os.getenv("ENV") == "dev"
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=1 if dev_mode else int(os.getenv("WEB_CONCURRENCY", "2")),
+        reload=dev_mode,
+    )
\ No newline at end of file